@@ -0,0 +1,153 @@
+"""METAR服务性能基准测试
+
+用法：
+    python benchmark.py logging    # 缓存命中路径在不同日志配置下的耗时
+    python benchmark.py decode     # METAR解码吞吐量（首次解码与缓存命中）
+"""
+import logging
+import os
+import sys
+import time
+
+import main
+
+CACHE_HIT_AIRPORTS = ["ZSSS", "ZSSS,ZBAA,ZGGG,RJTT,EGLL"]
+CACHE_HIT_METARS = {
+    "ZSSS": "ZSSS 190600Z 09004MPS CAVOK 24/17 Q1017 NOSIG",
+    "ZBAA": "ZBAA 190600Z 32003MPS 9999 FEW040 18/04 Q1021 NOSIG",
+    "ZGGG": "ZGGG 190600Z 35003MPS 9999 SCT030 27/19 Q1014 NOSIG",
+    "RJTT": "RJTT 190600Z 03008KT 9999 FEW030 BKN100 21/15 Q1019 NOSIG",
+    "EGLL": "EGLL 190550Z AUTO 24012KT 9999 NCD 11/07 Q1008 NOSIG",
+}
+
+# 各大洲机场的METAR样本，覆盖公制/英制单位、RVR、天气现象、趋势和备注
+WORLDWIDE_METARS = [
+    "ZSSS 190600Z 09004MPS CAVOK 24/17 Q1017 NOSIG",
+    "ZBAA 190600Z 32003MPS 9999 FEW040 18/04 Q1021 NOSIG",
+    "ZGGG 190600Z 35003MPS 310V030 9999 SCT030 27/19 Q1014 NOSIG",
+    "VHHH 190600Z 07012KT 9999 FEW020 SCT045 26/20 Q1016 NOSIG",
+    "RJTT 190600Z 03008KT 9999 FEW030 BKN100 21/15 Q1019 NOSIG",
+    "RKSI 190600Z 32010KT CAVOK 17/06 Q1022 NOSIG",
+    "WSSS 190600Z 19008KT 150V230 9999 -TSRA FEW015CB SCT018 BKN150 29/25 Q1009 TEMPO TS",
+    "VIDP 190600Z 29004KT 2500 HZ NSC 31/18 Q1012 NOSIG",
+    "OMDB 190600Z 33010KT 6000 NSC 34/21 Q1012 NOSIG",
+    "LLBG 190550Z 29008KT CAVOK 27/17 Q1013 NOSIG",
+    "EGLL 190550Z AUTO 24012KT 9999 NCD 11/07 Q1008 NOSIG",
+    "LFPG 190600Z 22010KT 9999 -RA BKN012 OVC030 12/10 Q1005 TEMPO 4000 RA BKN008",
+    "EDDF 190550Z 21008KT 9999 FEW025 SCT040 10/06 Q1010 BECMG 25015G25KT",
+    "EHAM 190555Z 23018G28KT 9999 -SHRA FEW012 SCT020CB 11/08 Q1002 TEMPO 23025G38KT 3000 SHRA",
+    "LEMD 190600Z 02005KT CAVOK 09/03 Q1024 NOSIG",
+    "LIRF 190550Z 03006KT 9999 FEW035 14/09 Q1020 NOSIG",
+    "UUEE 190600Z 00000MPS 0400 R24/0550N R06/0600U FZFG VV002 M05/M06 Q1030 NOSIG",
+    "ESSA 190550Z 18006KT 4000 -SN BR OVC008 M01/M02 Q0998 TEMPO 1500 SN",
+    "BIKF 190600Z 06022G34KT 8000 -SN FEW010 BKN020 M03/M07 Q0987",
+    "KJFK 190551Z 31015G25KT 10SM FEW050 BKN250 13/M02 A2992 RMK AO2 SLP132 T01331017",
+    "KORD 190551Z 28012KT 1 1/2SM R10L/2200V3000FT/U -TSRA BR FEW008 BKN025CB OVC050 09/08 A2978 RMK AO2 TSB30",
+    "KLAX 190553Z 00000KT 1/2SM FG VV002 16/16 A2995 RMK AO2 SLP142",
+    "KDEN 190553Z 19008KT P6SM SKC 02/M08 A3012 RMK AO2",
+    "CYYZ 190600Z 25010KT 15SM FEW030 BKN060 07/02 A2998 RMK SC2AC4 SLP160",
+    "MMMX 190542Z 00000KT 6SM HZ SCT020 BKN080 14/11 A3030 RMK 8/350",
+    "SBGR 190600Z 12006KT 9999 BKN015 17/15 Q1018",
+    "SAEZ 190600Z 14010KT 9999 SCT020 12/08 Q1021 NOSIG",
+    "SCEL 190600Z 20004KT CAVOK 09/04 Q1019 NOSIG",
+    "FAOR 190600Z 33007KT CAVOK 12/M02 Q1025 NOSIG",
+    "HECA 190600Z 02008KT CAVOK 22/14 Q1014 NOSIG",
+    "DNMM 190600Z 23005KT 7000 SCT010 FEW030CB BKN250 25/24 Q1012 NOSIG",
+    "HKJK 190600Z 07010KT 9999 BKN020 16/12 Q1023 NOSIG",
+    "YSSY 190600Z 16015KT 9999 -SHRA FEW015 SCT030 BKN045 15/10 Q1020 TEMPO 3000 SHRA BKN012",
+    "NZAA 190600Z 24016G27KT 9999 SHRA FEW012 SCT020TCU BKN045 14/10 Q1004 BECMG 25012KT",
+    "YPPH 190600Z 09008KT CAVOK 21/05 Q1026",
+    "PHNL 190553Z 06012KT 10SM FEW025 SCT045 26/18 A3004 RMK AO2 SLP172",
+    "PANC 190553Z 36004KT 10SM BKN050 OVC080 M02/M08 A2989 RMK AO2",
+    "VTBS 190600Z 21008KT 9999 FEW020 SCT300 32/24 Q1008 NOSIG",
+    "RPLL 190600Z 26008KT 9999 FEW020CB BKN100 31/25 Q1007 NOSIG",
+    "WIII 190600Z 35006KT 8000 FEW018CB SCT020 32/24 Q1009 NOSIG",
+]
+
+
+def _time_calls(func, arg, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func(arg)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def _run_cache_hits(label, iterations):
+    for airports in CACHE_HIT_AIRPORTS:
+        with main.app.test_request_context(f"/{airports}"):
+            main.handle_airports(airports)  # 预热
+            per_call = _time_calls(main.handle_airports, airports, iterations)
+        print(f"{label:<28} {airports:<28} {per_call:8.2f} us/req")
+
+
+def bench_logging(iterations=20000):
+    """比较缓存命中路径在日志关闭、异步队列日志、同步日志下的耗时"""
+    for airport, metar in CACHE_HIT_METARS.items():
+        main.set_cached_metar(airport, metar)
+
+    root = logging.getLogger()
+    devnull = open(os.devnull, "w", encoding="utf-8")
+    for handler in main.log_listener.handlers:
+        handler.setStream(devnull)
+
+    # 关闭所有logger（包括main.hot和main.access），作为基线
+    logging.disable(logging.CRITICAL)
+    _run_cache_hits("logging off", iterations)
+    logging.disable(logging.NOTSET)
+
+    _run_cache_hits("queue + rate limit (INFO)", iterations)
+
+    root.setLevel(logging.DEBUG)
+    _run_cache_hits("queue + rate limit (DEBUG)", iterations)
+    root.setLevel(logging.INFO)
+
+    # 请求线程内同步格式化并写出，保留限流，只比较队列的作用
+    queue_handlers = root.handlers[:]
+    sync_handler = logging.StreamHandler(devnull)
+    sync_handler.setFormatter(logging.Formatter(main.LOG_FORMAT))
+    root.handlers = [sync_handler]
+    root.setLevel(logging.DEBUG)
+    _run_cache_hits("sync + rate limit (DEBUG)", iterations)
+
+    # 旧方案：同步写出且不限流，与上一项相比为限流的作用
+    hot = logging.getLogger(main.__name__ + ".hot")
+    hot_filters = hot.filters[:]
+    hot.filters = []
+    _run_cache_hits("sync, no rate limit (DEBUG)", iterations)
+    hot.filters = hot_filters
+    root.handlers = queue_handlers
+    root.setLevel(logging.INFO)
+
+
+def bench_decode(rounds=500):
+    """解码吞吐量：清空缓存后的首次解码，以及同一批报文的缓存命中"""
+    total = len(WORLDWIDE_METARS) * rounds
+
+    main.decode_metar.cache_clear()
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for metar in WORLDWIDE_METARS:
+            main.decode_metar.__wrapped__(metar)
+    elapsed = time.perf_counter() - start
+    print(f"{'uncached':<12} {total / elapsed:12,.0f} reports/s  {elapsed / total * 1e6:8.2f} us/report")
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for metar in WORLDWIDE_METARS:
+            main.decode_metar(metar)
+    elapsed = time.perf_counter() - start
+    print(f"{'memoized':<12} {total / elapsed:12,.0f} reports/s  {elapsed / total * 1e6:8.2f} us/report")
+    print(main.decode_metar.cache_info())
+
+
+BENCHMARKS = {
+    "logging": bench_logging,
+    "decode": bench_decode,
+}
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        print(f"== {name} ==")
+        BENCHMARKS[name]()
@@ -1,6 +1,10 @@
 import requests, json
-from flask import Flask
+from flask import Flask, request, g, Response
 import logging
+import logging.handlers
+import queue
+import atexit
+import os
 import time
 import random
 import re
@@ -8,28 +12,161 @@ from threading import Lock
 import concurrent.futures
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import threading
+import sys
+import hmac
+from collections import Counter, deque
+import heapq
+from contextlib import contextmanager
+from functools import lru_cache
+from datetime import datetime, timedelta, timezone
 import psutil
 
 # 配置日志 - 只记录我们自己的日志，不记录werkzeug的访问日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler()
-    ]
-)
+# 请求线程只把日志记录放入队列，格式化和控制台输出都由后台线程完成
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+LOG_LEVEL = os.environ.get('METAR_LOG_LEVEL', 'INFO').upper()
+HOT_LOG_INTERVAL = 10  # 热路径日志限流：同一条日志每10秒最多输出一次
+ACCESS_LOG = os.environ.get('METAR_ACCESS_LOG')  # 可选的JSON访问日志文件路径，"-"表示输出到控制台
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """不在请求线程中格式化日志，原样交给后台线程处理"""
+
+    def prepare(self, record):
+        return record
+
+
+class RateLimitFilter(logging.Filter):
+    """按日志模板限流，被省略的条数会附加到下一次输出中"""
+
+    def __init__(self, interval):
+        super().__init__()
+        self.interval = interval
+        self.last_emit = {}
+        self.suppressed = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        now = time.monotonic()
+        key = (record.name, record.msg)
+        with self.lock:
+            last = self.last_emit.get(key)
+            if last is not None and now - last < self.interval:
+                self.suppressed[key] = self.suppressed.get(key, 0) + 1
+                return False
+            self.last_emit[key] = now
+            suppressed = self.suppressed.pop(key, 0)
+
+        if suppressed:
+            record.msg = f"{record.msg} (已省略{suppressed}条相同日志)"
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """结构化访问日志，每行一个JSON对象"""
+
+    def format(self, record):
+        entry = {"time": round(record.created, 3)}
+        entry.update(getattr(record, "access", {}))
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def setup_logging():
+    """配置基于队列的异步日志，返回后台写日志的监听器"""
+    log_queue = queue.SimpleQueue()
+
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    root.addHandler(DeferredQueueHandler(log_queue))
+
+    # 热路径上的日志单独使用一个logger并限流
+    logging.getLogger(__name__ + '.hot').addFilter(RateLimitFilter(HOT_LOG_INTERVAL))
+
+    access = logging.getLogger(__name__ + '.access')
+    access.propagate = False
+    access.disabled = not ACCESS_LOG
+    if ACCESS_LOG:
+        access_queue = queue.SimpleQueue()
+        access.setLevel(logging.INFO)
+        access.addHandler(DeferredQueueHandler(access_queue))
+        if ACCESS_LOG == '-':
+            access_handler = logging.StreamHandler()
+        else:
+            access_handler = logging.FileHandler(ACCESS_LOG, encoding='utf-8')
+        access_handler.setFormatter(JsonFormatter())
+        access_listener = logging.handlers.QueueListener(access_queue, access_handler)
+        access_listener.start()
+        atexit.register(access_listener.stop)
+
+    listener = logging.handlers.QueueListener(log_queue, console_handler)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+log_listener = setup_logging()
 
 # 关闭werkzeug的访问日志
 logging.getLogger('werkzeug').setLevel(logging.WARNING)
 
 logger = logging.getLogger(__name__)
+hot_logger = logging.getLogger(__name__ + '.hot')
+access_logger = logging.getLogger(__name__ + '.access')
 
 app = Flask(__name__)
 
+
+@app.before_request
+def start_access_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def add_degraded_header(response):
+    """限流或过载时只返回了缓存数据，通过响应头告知客户端"""
+    degraded = g.get('degraded')
+    if degraded:
+        response.headers['X-Metar-Degraded'] = degraded
+    return response
+
+
+@app.after_request
+def write_access_log(response):
+    """写入结构化访问日志（未开启时直接跳过）"""
+    if not access_logger.disabled:
+        access_logger.info("access", extra={"access": {
+            "remote_addr": request.remote_addr,
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "bytes": response.calculate_content_length(),
+            "duration_ms": round((time.perf_counter() - g.request_start) * 1000, 2),
+            "degraded": g.get('degraded'),
+        }})
+    return response
+
+
 # 缓存机制
 metar_cache = {}
 cache_lock = Lock()
 CACHE_TIMEOUT = 300  # 5分钟缓存
+STALE_CACHE_TIMEOUT = 3600  # 过期缓存最多保留1小时，上游不可用或限流时使用
+
+# TAF缓存，按有效期决定缓存时间：机场 -> (TAF, 过期时间, 有效期结束时间)
+taf_cache = {}
+TAF_CACHE_VALIDITY_FRACTION = 12  # 缓存时间取有效期长度的1/12（9小时TAF约45分钟）
+TAF_CACHE_MAX_TIMEOUT = 3600  # TAF最长缓存1小时，避免错过修订报
+
+# 准入控制
+RATE_LIMIT_PER_SECOND = 1  # 每个客户端每秒可触发的上游批量请求数
+RATE_LIMIT_BURST = 20  # 每个客户端的突发上限
+RATE_LIMIT_MAX_CLIENTS = 10000  # 超过后清理已回满的客户端令牌桶
+MAX_INFLIGHT_FETCHES = 4  # 全局同时进行的上游请求数
+MAX_QUEUED_FETCHES = 16  # 等待上游请求的最大排队数
+FETCH_QUEUE_TIMEOUT = 2  # 排队等待上限（秒），超时后只返回缓存
 
 # VATSIM数据缓存
 vatsim_all_cache = None
@@ -50,6 +187,33 @@ AIRPORT_LIST_PATTERN = re.compile(r'^[A-Z]{4}(?:,[A-Z]{4})*$')
 VALID_AIRPORT_PATTERN_CASE_INSENSITIVE = re.compile(r'^[A-Za-z]{4}$')
 AIRPORT_LIST_PATTERN_CASE_INSENSITIVE = re.compile(r'^[A-Za-z]{4}(?:,[A-Za-z]{4})*$')
 
+# METAR解码 - 单个正则按报文组分类，外层命名组即报文组类型
+METAR_TOKEN_PATTERN = re.compile(
+    r'(?P<time>(?P<day>\d{2})(?P<hour>\d{2})(?P<minute>\d{2})Z)'
+    r'|(?P<wind>(?P<wind_dir>\d{3}|VRB)(?P<wind_speed>P?\d{2,3})(?:G(?P<wind_gust>P?\d{2,3}))?'
+    r'(?P<wind_unit>KT|MPS|KMH))'
+    r'|(?P<wind_var>(?P<wind_from>\d{3})V(?P<wind_to>\d{3}))'
+    r'|(?P<cavok>CAVOK)'
+    r'|(?P<vis>(?P<vis_m>\d{4})(?P<vis_dir>NDV|[NSEW]{1,2})?)'
+    r'|(?P<vis_sm>(?P<vis_sm_mod>[PM])?(?P<vis_sm_value>\d+(?:/\d+)?)SM)'
+    r'|(?P<rvr>R(?P<rvr_runway>\d{2}[LCR]?)/(?P<rvr_min>[PM]?\d{4})(?:V(?P<rvr_max>[PM]?\d{4}))?'
+    r'(?P<rvr_unit>FT)?/?(?P<rvr_trend>[UDN])?)'
+    r'|(?P<cloud>(?P<cloud_cover>FEW|SCT|BKN|OVC|VV)(?P<cloud_height>\d{3}|///)(?P<cloud_type>CB|TCU|///)?)'
+    r'|(?P<sky_clear>NSC|NCD|SKC|CLR)'
+    r'|(?P<temp>(?P<temp_air>M?\d{2})/(?P<temp_dew>M?\d{2})?)'
+    r'|(?P<qnh>(?P<qnh_unit>[QA])(?P<qnh_value>\d{4}))'
+    r'|(?P<trend>NOSIG|BECMG|TEMPO)'
+    r'|(?P<flag>AUTO|COR)'
+    r'|(?P<weather>(?P<wx_intensity>[-+]|VC)?(?P<wx_descriptor>MI|BC|PR|DR|BL|SH|TS|FZ)?'
+    r'(?P<wx_phenomena>(?:DZ|RA|SN|SG|IC|PL|GR|GS|UP|BR|FG|FU|VA|DU|SA|HZ|PY|PO|SQ|FC|SS|DS)*))'
+)
+DECODE_CACHE_SIZE = 4096  # 按原始报文缓存解码结果
+
+# TAF有效期组，例如 1906/2012
+TAF_VALIDITY_PATTERN = re.compile(r'\b(\d{2})(\d{2})/(\d{2})(\d{2})\b')
+TAF_ISSUE_TIME_PATTERN = re.compile(r'\b(\d{2})(\d{2})(\d{2})Z\b')  # 发布时间，例如 190500Z
+XIAMENAIR_TAF_PATTERN = re.compile(r'TAF\s+(?:(?:AMD|COR)\s+)?[A-Z]{4}\s+\d{6}Z[\s\S]+?=')
+
 
 # 性能监控
 class PerformanceMonitor:
@@ -77,6 +241,276 @@ class PerformanceMonitor:
 perf_monitor = PerformanceMonitor()
 
 
+class TokenBucketLimiter:
+    """按客户端的令牌桶限速"""
+
+    def __init__(self, rate, burst, max_clients):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.buckets = {}
+        self.rejected = 0
+        self.lock = threading.Lock()
+
+    def allow(self, client, cost=1):
+        now = time.monotonic()
+        cost = min(cost, self.burst)
+        with self.lock:
+            tokens, last = self.buckets.get(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            else:
+                self.rejected += 1
+            self.buckets[client] = (tokens, now)
+
+            if len(self.buckets) > self.max_clients:
+                self._prune(now)
+        return allowed
+
+    def _prune(self, now):
+        """删除已回满的令牌桶，这些客户端重新出现时结果相同"""
+        self.buckets = {
+            client: (tokens, last) for client, (tokens, last) in self.buckets.items()
+            if tokens + (now - last) * self.rate < self.burst
+        }
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                "clients": len(self.buckets),
+                "rejected": self.rejected,
+                "rate_per_second": self.rate,
+                "burst": self.burst
+            }
+
+
+class AdmissionController:
+    """限制同时进行的上游请求数，超出时有限排队，排不上则拒绝"""
+
+    def __init__(self, max_inflight, max_queue, queue_timeout):
+        self.max_inflight = max_inflight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.inflight = 0
+        self.queued = 0
+        self.admitted = 0
+        self.queued_total = 0
+        self.shed = 0
+        self.cond = threading.Condition()
+
+    def acquire(self):
+        """获取上游请求名额，返回是否成功；成功后必须调用release"""
+        with self.cond:
+            if self.inflight >= self.max_inflight:
+                if self.queued >= self.max_queue:
+                    self.shed += 1
+                    return False
+
+                self.queued += 1
+                self.queued_total += 1
+                try:
+                    admitted = self.cond.wait_for(lambda: self.inflight < self.max_inflight, self.queue_timeout)
+                finally:
+                    self.queued -= 1
+                if not admitted:
+                    self.shed += 1
+                    return False
+
+            self.inflight += 1
+            self.admitted += 1
+            return True
+
+    def release(self):
+        with self.cond:
+            self.inflight -= 1
+            self.cond.notify()
+
+    def get_stats(self):
+        with self.cond:
+            return {
+                "inflight": self.inflight,
+                "queued": self.queued,
+                "max_inflight": self.max_inflight,
+                "max_queue": self.max_queue,
+                "admitted": self.admitted,
+                "queued_total": self.queued_total,
+                "shed": self.shed
+            }
+
+
+rate_limiter = TokenBucketLimiter(RATE_LIMIT_PER_SECOND, RATE_LIMIT_BURST, RATE_LIMIT_MAX_CLIENTS)
+admission = AdmissionController(MAX_INFLIGHT_FETCHES, MAX_QUEUED_FETCHES, FETCH_QUEUE_TIMEOUT)
+
+
+# 请求追踪
+TRACE_BUFFER_SIZE = 200  # 保留最近200个请求的追踪数据
+SLOWEST_TRACE_COUNT = 50  # 单独保留最慢的50个请求
+SLOWEST_TRACE_WINDOW = 600  # 最慢请求的统计时间窗口（秒）
+DEBUG_TOKEN = os.environ.get('METAR_DEBUG_TOKEN')  # 性能剖析端点的访问令牌，未设置时端点关闭
+PROFILE_MAX_SECONDS = 30
+PROFILE_INTERVAL = 0.005  # 采样间隔5毫秒
+
+
+class RequestTrace:
+    """单个请求的追踪数据，记录各阶段耗时"""
+
+    def __init__(self, name):
+        self.name = name
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.duration = None
+        self.spans = []
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name, **attrs):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            with self.lock:
+                self.spans.append({
+                    "name": name,
+                    "start_ms": round((start - self.start) * 1000, 2),
+                    "duration_ms": round((end - start) * 1000, 2),
+                    "thread": threading.current_thread().name,
+                    **attrs
+                })
+
+    def wrap(self, name, func, **attrs):
+        """包装函数，使其在线程池中执行时也记录到当前追踪"""
+        def traced(*args, **kwargs):
+            with self.span(name, **attrs):
+                return func(*args, **kwargs)
+        return traced
+
+    def finish(self):
+        self.duration = time.perf_counter() - self.start
+
+    def to_dict(self):
+        with self.lock:
+            spans = sorted(self.spans, key=lambda s: s["start_ms"])
+        return {
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration * 1000, 2) if self.duration is not None else None,
+            "spans": spans
+        }
+
+
+class NullTrace(RequestTrace):
+    """不在请求上下文中调用时使用，不记录任何数据"""
+
+    def __init__(self):
+        super().__init__("")
+
+    @contextmanager
+    def span(self, name, **attrs):
+        yield
+
+    def wrap(self, name, func, **attrs):
+        return func
+
+
+class TraceStore:
+    """保存请求追踪：最慢的若干个请求单独保存，另有最近请求的环形缓冲区作参考"""
+
+    def __init__(self, size, slowest_size, slowest_window):
+        self.traces = deque(maxlen=size)
+        self.slowest_size = slowest_size
+        self.slowest_window = slowest_window
+        self.slowest_heap = []  # 按耗时排序的小顶堆：(耗时, 序号, 完成时间, 追踪)
+        self.sequence = 0
+        self.last_prune = 0
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    def start(self, name):
+        trace = RequestTrace(name)
+        self.local.trace = trace
+        return trace
+
+    def finish(self, trace):
+        trace.finish()
+        self.local.trace = None
+        now = time.monotonic()
+        with self.lock:
+            self.traces.append(trace)
+
+            # 每秒最多清理一次超出时间窗口的慢请求，避免旧数据长期占位
+            if now - self.last_prune >= 1:
+                self.last_prune = now
+                self._prune(now)
+
+            self.sequence += 1
+            entry = (trace.duration, self.sequence, now, trace)
+            if len(self.slowest_heap) < self.slowest_size:
+                heapq.heappush(self.slowest_heap, entry)
+            elif trace.duration > self.slowest_heap[0][0]:
+                heapq.heapreplace(self.slowest_heap, entry)
+
+    def _prune(self, now):
+        kept = [entry for entry in self.slowest_heap if now - entry[2] < self.slowest_window]
+        if len(kept) != len(self.slowest_heap):
+            heapq.heapify(kept)
+            self.slowest_heap = kept
+
+    def current(self):
+        return getattr(self.local, "trace", None) or NULL_TRACE
+
+    def slowest(self, limit):
+        now = time.monotonic()
+        with self.lock:
+            self._prune(now)
+            entries = heapq.nlargest(limit, self.slowest_heap)
+        return [entry[3].to_dict() for entry in entries]
+
+    def recent(self, limit):
+        with self.lock:
+            traces = list(self.traces)[-limit:]
+        return [t.to_dict() for t in reversed(traces)]
+
+
+class SamplingProfiler:
+    """采样式性能剖析，输出flamegraph.pl可直接使用的折叠栈格式"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+
+    def run(self, seconds, interval):
+        """采样seconds秒，已有剖析在运行时返回None"""
+        if not self.lock.acquire(blocking=False):
+            return None
+        try:
+            stacks = Counter()
+            own_ident = threading.get_ident()
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                thread_names = {t.ident: t.name for t in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident == own_ident:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        code = frame.f_code
+                        stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                        frame = frame.f_back
+                    stack.append(thread_names.get(ident, str(ident)))
+                    stacks[";".join(reversed(stack))] += 1
+                time.sleep(interval)
+            return stacks
+        finally:
+            self.lock.release()
+
+
+NULL_TRACE = NullTrace()
+trace_store = TraceStore(TRACE_BUFFER_SIZE, SLOWEST_TRACE_COUNT, SLOWEST_TRACE_WINDOW)
+profiler = SamplingProfiler()
+
+
 def get_headers():
     return {
         'User-Agent': random.choice(USER_AGENTS),
@@ -103,6 +537,194 @@ def clean_metar(metar_text):
     return metar_text
 
 
+def clean_taf(taf_text):
+    """清理TAF文本，多行报文合并为一行"""
+    taf_text = ' '.join(taf_text.split()).rstrip('= ')
+    if taf_text.startswith("TAF "):
+        taf_text = taf_text[len("TAF "):]
+    return taf_text
+
+
+def _taf_time(day, hour, now):
+    """TAF只给出日和时，取离当前时间最近的月份换算为时间戳"""
+    candidates = []
+    for month_offset in (-1, 0, 1):
+        year, month = divmod(now.year * 12 + now.month - 1 + month_offset, 12)
+        try:
+            start = datetime(year, month + 1, day, tzinfo=timezone.utc)
+        except ValueError:
+            continue
+        candidates.append(start + timedelta(hours=hour))
+    if not candidates:
+        return None
+    return min(candidates, key=lambda t: abs(t - now)).timestamp()
+
+
+def taf_issue_time(taf_text, now=None):
+    """解析TAF发布时间（ddhhmmZ），返回时间戳，无法解析时返回None"""
+    match = TAF_ISSUE_TIME_PATTERN.search(taf_text)
+    if not match:
+        return None
+
+    now = datetime.fromtimestamp(now or time.time(), timezone.utc)
+    day, hour, minute = (int(part) for part in match.groups())
+    issued = _taf_time(day, hour, now)
+    return issued + minute * 60 if issued is not None else None
+
+
+def taf_validity(taf_text, now=None):
+    """解析TAF有效期，返回(开始时间戳, 结束时间戳)，无法解析时返回None"""
+    match = TAF_VALIDITY_PATTERN.search(taf_text)
+    if not match:
+        return None
+
+    now = datetime.fromtimestamp(now or time.time(), timezone.utc)
+    from_day, from_hour, to_day, to_hour = (int(part) for part in match.groups())
+    valid_from = _taf_time(from_day, from_hour, now)
+    valid_until = _taf_time(to_day, to_hour, now)
+    if valid_from is None or valid_until is None or valid_until <= valid_from:
+        return None
+    return valid_from, valid_until
+
+
+def _metar_temperature(value):
+    return -int(value[1:]) if value.startswith('M') else int(value)
+
+
+def _metar_rvr_value(value):
+    return int(value.lstrip('PM')) if value else None
+
+
+def _metar_fraction(value):
+    """英制能见度数值，分母为0等无效分数返回None"""
+    if '/' in value:
+        numerator, denominator = value.split('/')
+        if int(denominator) == 0:
+            return None
+        return int(numerator) / int(denominator)
+    return int(value)
+
+
+@lru_cache(maxsize=DECODE_CACHE_SIZE)
+def decode_metar(metar_text):
+    """解码METAR报文，结果按原始报文缓存（返回的字典为共享对象，不要修改）"""
+    decoded = {
+        "station": None,
+        "observation_time": None,
+        "auto": False,
+        "wind": None,
+        "visibility": None,
+        "cavok": False,
+        "rvr": [],
+        "weather": [],
+        "clouds": [],
+        "temperature": None,
+        "dewpoint": None,
+        "qnh": None,
+        "trends": [],
+        "remarks": None
+    }
+
+    tokens = metar_text.rstrip('= ').split()
+    trend = None
+    whole_miles = 0
+    for index, token in enumerate(tokens):
+        if token == 'RMK':
+            decoded["remarks"] = ' '.join(tokens[index + 1:])
+            break
+
+        match = METAR_TOKEN_PATTERN.fullmatch(token)
+        kind = match.lastgroup if match else None
+
+        # 变化趋势组之后的内容原样归入该趋势
+        if kind == 'trend':
+            trend = {"type": token, "text": ""}
+            decoded["trends"].append(trend)
+            continue
+        if trend is not None:
+            trend["text"] = f"{trend['text']} {token}".lstrip()
+            continue
+
+        if index == 0 and len(token) == 4 and token.isalnum():
+            decoded["station"] = token
+        elif kind == 'time':
+            decoded["observation_time"] = {
+                "day": int(match['day']),
+                "hour": int(match['hour']),
+                "minute": int(match['minute'])
+            }
+        elif kind == 'flag':
+            decoded["auto"] = decoded["auto"] or token == 'AUTO'
+        elif kind == 'wind':
+            direction = match['wind_dir']
+            gust = match['wind_gust']
+            decoded["wind"] = {
+                "direction": direction if direction == 'VRB' else int(direction),
+                "speed": int(match['wind_speed'].lstrip('P')),
+                "gust": int(gust.lstrip('P')) if gust else None,
+                "unit": match['wind_unit'],
+                "variable": None
+            }
+        elif kind == 'wind_var' and decoded["wind"]:
+            decoded["wind"]["variable"] = [int(match['wind_from']), int(match['wind_to'])]
+        elif kind == 'cavok':
+            decoded["cavok"] = True
+        elif kind == 'vis':
+            if decoded["visibility"] is None:
+                decoded["visibility"] = {"value": int(match['vis_m']), "unit": "m", "modifier": None}
+            else:
+                decoded["visibility"]["minimum"] = {"value": int(match['vis_m']), "direction": match['vis_dir']}
+        elif kind == 'vis_sm':
+            miles = _metar_fraction(match['vis_sm_value'])
+            if miles is not None:
+                decoded["visibility"] = {
+                    "value": whole_miles + miles,
+                    "unit": "SM",
+                    "modifier": match['vis_sm_mod']
+                }
+        elif kind == 'rvr':
+            rvr_min = match['rvr_min']
+            decoded["rvr"].append({
+                "runway": match['rvr_runway'],
+                "value": _metar_rvr_value(rvr_min),
+                "max_value": _metar_rvr_value(match['rvr_max']),
+                "modifier": rvr_min[0] if rvr_min[0] in 'PM' else None,
+                "unit": "ft" if match['rvr_unit'] else "m",
+                "trend": match['rvr_trend']
+            })
+        elif kind == 'cloud':
+            height = match['cloud_height']
+            cloud_type = match['cloud_type']
+            decoded["clouds"].append({
+                "cover": match['cloud_cover'],
+                "height_ft": int(height) * 100 if height != '///' else None,
+                "type": cloud_type if cloud_type != '///' else None
+            })
+        elif kind == 'sky_clear':
+            decoded["clouds"].append({"cover": token, "height_ft": None, "type": None})
+        elif kind == 'temp':
+            decoded["temperature"] = _metar_temperature(match['temp_air'])
+            if match['temp_dew']:
+                decoded["dewpoint"] = _metar_temperature(match['temp_dew'])
+        elif kind == 'qnh':
+            value = int(match['qnh_value'])
+            if match['qnh_unit'] == 'Q':
+                decoded["qnh"] = {"hpa": value, "inhg": round(value / 33.8639, 2)}
+            else:
+                decoded["qnh"] = {"hpa": round(value / 100 * 33.8639), "inhg": value / 100}
+        elif kind == 'weather' and (match['wx_descriptor'] or match['wx_phenomena']):
+            decoded["weather"].append({
+                "intensity": match['wx_intensity'],
+                "descriptor": match['wx_descriptor'],
+                "phenomena": match['wx_phenomena'] or None
+            })
+
+        # 美制能见度的整数部分单独成组，例如 "1 1/2SM"
+        whole_miles = int(token) if token.isdigit() and len(token) == 1 else 0
+
+    return decoded
+
+
 def fetch_vatsim_all_cached():
     """获取缓存的VATSIM ALL数据"""
     global vatsim_all_cache, vatsim_cache_time
@@ -124,13 +746,13 @@ def fetch_vatsim_all_cached():
         if res.status_code == 200:
             vatsim_all_cache = res.text
             vatsim_cache_time = current_time
-            logger.info(f"获取VATSIM ALL数据成功，长度: {len(vatsim_all_cache)}")
+            logger.info("获取VATSIM ALL数据成功，长度: %s", len(vatsim_all_cache))
             return vatsim_all_cache
         else:
-            logger.warning(f"VATSIM ALL返回状态码: {res.status_code}")
+            logger.warning("VATSIM ALL返回状态码: %s", res.status_code)
             return None
     except Exception as e:
-        logger.error(f"从VATSIM获取数据时出错: {e}")
+        logger.error("从VATSIM获取数据时出错: %s", e)
         return vatsim_all_cache  # 返回旧的缓存数据
 
 
@@ -168,54 +790,66 @@ def parse_metar_from_vatsim_all(text, airport_codes):
 
         return results
     except Exception as e:
-        logger.error(f"解析VATSIM ALL数据时出错: {e}")
+        logger.error("解析VATSIM ALL数据时出错: %s", e)
         return {}
 
 
-def fetch_aviationweather_gov_bulk(airports_list):
-    """从aviationweather.gov批量获取METAR数据"""
+def fetch_aviationweather_gov_bulk(airports_list, include_taf=False):
+    """从aviationweather.gov批量获取METAR数据，include_taf为True时在同一次请求中获取TAF
+
+    返回(METAR字典, TAF字典, 是否成功应答)。报文按机场代码归类，不依赖返回顺序；
+    请求失败时第三项为False，以便区分"获取失败"和"机场没有TAF"。
+    """
     if not airports_list:
-        return {}
+        return {}, {}, False
 
     try:
         airports_str = ','.join(airports_list)
-        logger.debug(f"请求aviationweather.gov: {airports_str}")
+        logger.debug("请求aviationweather.gov: %s", airports_str)
 
         res = requests.get(
-            f"https://aviationweather.gov/api/data/metar?ids={airports_str}",
+            f"https://aviationweather.gov/api/data/metar?ids={airports_str}" + ("&taf=true" if include_taf else ""),
             headers=get_headers(),
             timeout=5  # 增加超时时间
         )
 
-        results = {}
         if res.status_code == 200 and res.text.strip():
-            metars = res.text.strip().split('\n')
-
-            for i, airport in enumerate(airports_list):
-                if i < len(metars):
-                    metar_text = metars[i].strip()
-                    if metar_text and "not found" not in metar_text.lower():
-                        results[airport] = clean_metar(metar_text)
-                    else:
-                        results[airport] = ""
+            # TAF的变化组为缩进的续行，先合并为完整报文再按机场代码归类
+            reports = []
+            for line in res.text.splitlines():
+                if not line.strip():
+                    continue
+                if line[0].isspace() and reports:
+                    reports[-1] += ' ' + line.strip()
                 else:
-                    results[airport] = ""
-
-            if results:
-                valid_count = len([v for v in results.values() if v])
-                if valid_count > 0:
-                    logger.info(f"aviationweather.gov获取成功: {valid_count}个机场")
-            return results
-        elif res.status_code == 204:
-            logger.debug("aviationweather.gov返回204 - 无内容")
-            return {airport: "" for airport in airports_list}
+                    reports.append(line.strip())
+
+            airport_set = set(airports_list)
+            metars, tafs = {}, {}
+            for report in reports:
+                tokens = report.split()
+                is_taf = tokens[0] == 'TAF'
+                station = next((t for t in tokens if t not in ('METAR', 'SPECI', 'TAF', 'AMD', 'COR')), None)
+                if station not in airport_set:
+                    continue
+                if is_taf:
+                    tafs[station] = _newer_taf(tafs.get(station, ""), clean_taf(report))
+                else:
+                    metars.setdefault(station, clean_metar(report))
+
+            if metars or tafs:
+                hot_logger.info("aviationweather.gov获取成功: %s个METAR，%s个TAF", len(metars), len(tafs))
+            return metars, tafs, True
+        elif res.status_code in (200, 204):
+            logger.debug("aviationweather.gov返回%s - 无内容", res.status_code)
+            return {}, {}, True
         else:
-            logger.debug(f"aviationweather.gov返回状态码: {res.status_code}")
-            return {}
+            logger.debug("aviationweather.gov返回状态码: %s", res.status_code)
+            return {}, {}, False
 
     except Exception as e:
-        logger.debug(f"aviationweather.gov请求出错: {e}")
-        return {}
+        logger.debug("aviationweather.gov请求出错: %s", e)
+        return {}, {}, False
 
 
 def fetch_apocfly_bulk(airports_list):
@@ -225,7 +859,7 @@ def fetch_apocfly_bulk(airports_list):
 
     try:
         airports_str = ','.join(airports_list)
-        logger.debug(f"请求apocfly.com: {airports_str}")
+        logger.debug("请求apocfly.com: %s", airports_str)
 
         res = requests.get(
             f"https://www.apocfly.com/api/metar?icao={airports_str}",
@@ -249,7 +883,7 @@ def fetch_apocfly_bulk(airports_list):
                     if results:
                         valid_count = len([v for v in results.values() if v])
                         if valid_count > 0:
-                            logger.info(f"apocfly.com获取成功: {valid_count}个机场")
+                            hot_logger.info("apocfly.com获取成功: %s个机场", valid_count)
                     return results
                 else:
                     logger.debug("apocfly.com返回数据格式异常")
@@ -261,18 +895,18 @@ def fetch_apocfly_bulk(airports_list):
             logger.debug("apocfly.com返回404 - 未找到")
             return {airport: "" for airport in airports_list}
         else:
-            logger.debug(f"apocfly.com返回状态码: {res.status_code}")
+            logger.debug("apocfly.com返回状态码: %s", res.status_code)
             return {}
 
     except Exception as e:
-        logger.debug(f"apocfly.com请求出错: {e}")
+        logger.debug("apocfly.com请求出错: %s", e)
         return {}
 
 
-def fetch_single_xiamenair(airport):
-    """从厦航API获取单个机场METAR"""
+def fetch_xiamenair_reports(airport):
+    """从厦航API获取单个机场的METAR和TAF，返回(METAR, TAF, 是否成功应答)"""
     try:
-        logger.debug(f"请求xiamenair.com: {airport}")
+        logger.debug("请求xiamenair.com: %s", airport)
 
         res = requests.get(
             f"https://xmairavt7.xiamenair.com/WarningPage/AirportReports?arp4code={airport}/1",
@@ -282,32 +916,41 @@ def fetch_single_xiamenair(airport):
 
         if res.status_code == 200:
             content = res.text
+            metar = ""
             # 更精确的匹配模式
             patterns = [
                 r'METAR\s+[A-Z]{4}\s+\d{6}Z[\s\S]+?=',
                 r'SPECI\s+[A-Z]{4}\s+\d{6}Z[\s\S]+?=',
-                r'TAF\s+[A-Z]{4}\s+\d{6}Z[\s\S]+?=',
             ]
 
             for pattern in patterns:
                 matches = re.findall(pattern, content, re.DOTALL)
                 if matches:
                     metar_text = matches[0].strip()
-                    logger.debug(f"xiamenair.com找到METAR: {metar_text}")
-                    return clean_metar(metar_text)
+                    logger.debug("xiamenair.com找到METAR: %s", metar_text)
+                    metar = clean_metar(metar_text)
+                    break
+            else:
+                logger.debug("xiamenair.com未找到METAR格式数据")
 
-            logger.debug(f"xiamenair.com未找到METAR格式数据")
-            return ""
+            taf_match = XIAMENAIR_TAF_PATTERN.search(content)
+            taf = clean_taf(taf_match.group(0)) if taf_match else ""
+            return metar, taf, True
         elif res.status_code == 500:
             logger.debug("xiamenair.com服务器错误")
-            return ""
+            return "", "", False
         else:
-            logger.debug(f"xiamenair.com返回状态码: {res.status_code}")
-            return ""
+            logger.debug("xiamenair.com返回状态码: %s", res.status_code)
+            return "", "", False
 
     except Exception as e:
-        logger.debug(f"xiamenair.com请求出错: {e}")
-        return ""
+        logger.debug("xiamenair.com请求出错: %s", e)
+        return "", "", False
+
+
+def fetch_single_xiamenair(airport):
+    """从厦航API获取单个机场METAR"""
+    return fetch_xiamenair_reports(airport)[0]
 
 
 def get_cached_metar(airport):
@@ -315,13 +958,24 @@ def get_cached_metar(airport):
     with cache_lock:
         if airport in metar_cache:
             data, timestamp = metar_cache[airport]
-            if time.time() - timestamp < CACHE_TIMEOUT:
+            age = time.time() - timestamp
+            if age < CACHE_TIMEOUT:
                 return data
-            else:
+            elif age >= STALE_CACHE_TIMEOUT:
                 del metar_cache[airport]
     return None
 
 
+def get_stale_metar(airport):
+    """获取缓存的METAR数据，允许已过期但未超过STALE_CACHE_TIMEOUT的数据"""
+    with cache_lock:
+        if airport in metar_cache:
+            data, timestamp = metar_cache[airport]
+            if time.time() - timestamp < STALE_CACHE_TIMEOUT:
+                return data
+    return None
+
+
 def set_cached_metar(airport, metar_data):
     """设置缓存的METAR数据"""
     if metar_data:  # 只缓存有效数据
@@ -329,6 +983,64 @@ def set_cached_metar(airport, metar_data):
             metar_cache[airport] = (metar_data, time.time())
 
 
+def get_cached_taf(airport):
+    """获取缓存的TAF数据，空字符串表示该机场没有TAF，None表示未缓存"""
+    with cache_lock:
+        if airport in taf_cache:
+            data, expires_at, valid_until = taf_cache[airport]
+            now = time.time()
+            if now < expires_at:
+                return data
+            elif now >= valid_until:
+                del taf_cache[airport]
+    return None
+
+
+def get_valid_taf(airport):
+    """获取仍在有效期内的TAF，缓存时间已过也可使用"""
+    with cache_lock:
+        if airport in taf_cache:
+            data, expires_at, valid_until = taf_cache[airport]
+            if time.time() < valid_until:
+                return data
+    return ""
+
+
+def _is_older_taf(taf_data, current):
+    """taf_data为空，或发布时间明确早于current"""
+    if not taf_data:
+        return True
+    issued = taf_issue_time(taf_data)
+    current_issued = taf_issue_time(current)
+    return issued is not None and current_issued is not None and issued < current_issued
+
+
+def set_cached_taf(airport, taf_data):
+    """设置缓存的TAF数据，缓存时间由有效期决定且不超过有效期；空字符串按普通缓存时间缓存"""
+    now = time.time()
+    validity = taf_validity(taf_data, now) if taf_data else None
+    if validity and validity[1] <= now:
+        # 上游返回的TAF已过有效期，按没有TAF处理
+        taf_data, validity = "", None
+
+    with cache_lock:
+        current = taf_cache.get(airport)
+        if current and current[0] and now < current[2] and _is_older_taf(taf_data, current[0]):
+            # 仍在有效期内的TAF不会被空结果或更早发布的TAF覆盖，只推迟下次刷新
+            taf_cache[airport] = (current[0], min(now + CACHE_TIMEOUT, current[2]), current[2])
+            return
+
+        if validity:
+            valid_from, valid_until = validity
+            timeout = (valid_until - valid_from) / TAF_CACHE_VALIDITY_FRACTION
+            timeout = max(CACHE_TIMEOUT, min(timeout, TAF_CACHE_MAX_TIMEOUT))
+            expires_at = min(now + timeout, valid_until)
+        else:
+            expires_at = valid_until = now + CACHE_TIMEOUT
+
+        taf_cache[airport] = (taf_data, expires_at, valid_until)
+
+
 def normalize_airport_codes(airports_str):
     """标准化机场代码，转换为大写并验证格式"""
     # 转换为大写
@@ -363,12 +1075,37 @@ def _process_batch_result(data, source, airports_list, results):
                     if airport in data and data[airport] and airport not in results:
                         results[airport] = data[airport]
     except Exception as e:
-        logger.debug(f"处理{source}批量结果时出错: {e}")
+        logger.debug("处理%s批量结果时出错: %s", source, e)
+
+
+def _newer_taf(current, candidate):
+    """两份TAF中取发布时间较晚的一份（修订报AMD/更正报COR发布时间更晚），无法比较时保留current"""
+    if not current:
+        return candidate
+    if not candidate:
+        return current
+
+    current_issued = taf_issue_time(current)
+    candidate_issued = taf_issue_time(candidate)
+    if candidate_issued is not None and (current_issued is None or candidate_issued > current_issued):
+        return candidate
+    return current
+
 
+def _merge_taf_result(tafs, airport, taf):
+    """合并数据源返回的TAF，多个数据源都有TAF时保留发布时间较晚的，空结果不覆盖其他数据源的TAF"""
+    tafs[airport] = _newer_taf(tafs.get(airport, ""), taf)
 
-def _fetch_batch_metar(airports_list, max_workers, total_timeout):
-    """批量获取METAR数据"""
+
+def _fetch_batch_metar(airports_list, max_workers, total_timeout, tafs=None):
+    """批量获取METAR数据
+
+    传入tafs字典时，支持TAF的数据源在同一次请求中顺带获取TAF并写入tafs。
+    只有支持TAF的数据源成功应答的机场才会出现在tafs中，值为空字符串表示没有TAF。
+    """
     results = {}
+    include_taf = tafs is not None
+    trace = trace_store.current()
 
     try:
         with ThreadPoolExecutor(max_workers=max_workers) as executor:
@@ -376,27 +1113,31 @@ def _fetch_batch_metar(airports_list, max_workers, total_timeout):
             start_time = time.time()
 
             # 提交批量请求任务
-            vatsim_data = fetch_vatsim_all_cached()
+            with trace.span("vatsim_refresh"):
+                vatsim_data = fetch_vatsim_all_cached()
             if vatsim_data:
-                future = executor.submit(parse_metar_from_vatsim_all, vatsim_data, airports_list)
+                future = executor.submit(trace.wrap("parse_vatsim", parse_metar_from_vatsim_all),
+                                         vatsim_data, airports_list)
                 future_to_source[future] = "batch_vatsim"
 
-            # aviationweather.gov批量请求
+            # aviationweather.gov批量请求（需要时同时获取TAF）
             if airports_list:
-                future = executor.submit(fetch_aviationweather_gov_bulk, airports_list)
+                future = executor.submit(trace.wrap("aviationweather", fetch_aviationweather_gov_bulk),
+                                         airports_list, include_taf)
                 future_to_source[future] = "batch_aviationweather"
 
             # apocfly.com批量请求
             if airports_list:
-                future = executor.submit(fetch_apocfly_bulk, airports_list)
+                future = executor.submit(trace.wrap("apocfly", fetch_apocfly_bulk), airports_list)
                 future_to_source[future] = "batch_apocfly"
 
             # 为每个机场提交xiamenair请求
             xiamenair_futures = {}
+            xiamenair_fetcher = fetch_xiamenair_reports if include_taf else fetch_single_xiamenair
             for airport in airports_list:
-                future = executor.submit(fetch_single_xiamenair, airport)
+                future = executor.submit(trace.wrap("xiamenair", xiamenair_fetcher, airport=airport), airport)
                 xiamenair_futures[future] = airport
-                future_to_source[future] = "xiamenair"
+                future_to_source[future] = "xiamenair_taf" if include_taf else "xiamenair"
 
             # 处理已完成的任务
             completed_futures = []
@@ -413,50 +1154,70 @@ def _fetch_batch_metar(airports_list, max_workers, total_timeout):
                         source = future_to_source.pop(future, "unknown")
                         try:
                             data = future.result(timeout=1)
-                            if source in ["batch_vatsim", "batch_aviationweather", "batch_apocfly"]:
+                            if source in ["batch_vatsim", "batch_apocfly"]:
                                 _process_batch_result(data, source, airports_list, results)
+                            elif source == "batch_aviationweather":
+                                metars, batch_tafs, answered = data
+                                _process_batch_result(metars, source, airports_list, results)
+                                if include_taf and answered:
+                                    for airport in airports_list:
+                                        _merge_taf_result(tafs, airport, batch_tafs.get(airport, ""))
                             elif source == "xiamenair":
                                 airport = xiamenair_futures.get(future)
                                 if airport and airport not in results and data:
                                     results[airport] = data
+                            elif source == "xiamenair_taf":
+                                airport = xiamenair_futures.get(future)
+                                metar, taf, answered = data
+                                if airport and airport not in results and metar:
+                                    results[airport] = metar
+                                if airport and answered:
+                                    _merge_taf_result(tafs, airport, taf)
                         except Exception as e:
-                            logger.debug(f"处理{source}结果时出错: {e}")
+                            logger.debug("处理%s结果时出错: %s", source, e)
 
                     completed_futures.extend(done)
 
                 except Exception as e:
-                    logger.debug(f"等待任务完成时出错: {e}")
+                    logger.debug("等待任务完成时出错: %s", e)
 
             # 取消未完成的任务
             for future in list(future_to_source.keys()):
                 future.cancel()
 
     except Exception as e:
-        logger.error(f"批量获取METAR数据时出错: {e}")
+        logger.error("批量获取METAR数据时出错: %s", e)
 
     return results
 
 
-def fetch_metar_for_airports(airports_list):
-    """获取多个机场的METAR数据（优化版本）"""
+def fetch_metar_for_airports(airports_list, client=None, include_taf=False):
+    """获取多个机场的METAR数据（优化版本），返回(结果, 降级原因)
+
+    include_taf为True时，TAF未缓存的机场也会请求上游，获取到的TAF写入TAF缓存，
+    调用方通过get_valid_taf读取。
+    """
     if not airports_list:
-        return {}
+        return {}, None
 
     results = {}
+    trace = trace_store.current()
 
     # 第1步：检查缓存
     cached_airports = []
-    for airport in airports_list:
-        cached = get_cached_metar(airport)
-        if cached:
-            results[airport] = cached
-            cached_airports.append(airport)
+    with trace.span("cache_lookup", airports=len(airports_list)):
+        for airport in airports_list:
+            cached = get_cached_metar(airport)
+            if cached:
+                results[airport] = cached
+                if not include_taf or get_cached_taf(airport) is not None:
+                    cached_airports.append(airport)
 
     remaining_airports = [a for a in airports_list if a not in cached_airports]
     if not remaining_airports:
-        return results
+        return results, None
 
-    logger.info(f"需要从网络获取的机场: {remaining_airports}")
+    hot_logger.info("需要从网络获取的机场: %s", remaining_airports)
 
     # 第2步：使用更好的并发策略
     # 限制最大并发数和总超时时间
@@ -466,25 +1227,82 @@ def fetch_metar_for_airports(airports_list):
     # 分组处理，避免一次性并发太多
     BATCH_SIZE = 10
 
-    for i in range(0, len(remaining_airports), BATCH_SIZE):
-        batch = remaining_airports[i:i + BATCH_SIZE]
-        batch_results = _fetch_batch_metar(batch, MAX_WORKERS, TOTAL_TIMEOUT)
-
-        for airport, metar in batch_results.items():
-            if airport not in results and metar:
-                results[airport] = metar
-                set_cached_metar(airport, metar)
+    # 准入控制：超出客户端限速或全局上游并发上限时不再请求上游，只返回缓存
+    degraded = None
+    batch_count = -(-len(remaining_airports) // BATCH_SIZE)
+    if client is not None and not rate_limiter.allow(client, batch_count):
+        degraded = "rate-limited"
+    else:
+        with trace.span("admission"):
+            if not admission.acquire():
+                degraded = "overloaded"
 
-    # 确保所有请求的机场都有结果
+    if degraded:
+        hot_logger.warning("上游请求被拒绝(%s)，只返回缓存数据", degraded)
+    else:
+        try:
+            for i in range(0, len(remaining_airports), BATCH_SIZE):
+                batch = remaining_airports[i:i + BATCH_SIZE]
+                batch_tafs = {} if include_taf else None
+                with trace.span("fetch_batch", airports=len(batch)):
+                    batch_results = _fetch_batch_metar(batch, MAX_WORKERS, TOTAL_TIMEOUT, batch_tafs)
+
+                for airport, metar in batch_results.items():
+                    if airport not in results and metar:
+                        results[airport] = metar
+                        set_cached_metar(airport, metar)
+
+                if include_taf:
+                    # 只缓存支持TAF的数据源成功应答的结果，获取失败时保留原有缓存
+                    for airport, taf in batch_tafs.items():
+                        set_cached_taf(airport, taf)
+        finally:
+            admission.release()
+
+    # 确保所有请求的机场都有结果，获取不到时使用过期缓存，并标记为降级
     for airport in airports_list:
         if airport not in results:
-            results[airport] = ""
+            stale = get_stale_metar(airport)
+            results[airport] = stale or ""
+            if stale and not degraded:
+                degraded = "stale"
 
-    return results
+    return results, degraded
+
+
+def decoded_entry(metar):
+    """原始报文及其解码结果，解码失败时decoded为None，仍返回原始报文"""
+    decoded = None
+    if metar:
+        try:
+            decoded = decode_metar(metar)
+        except Exception as e:
+            logger.warning("解码METAR失败: %s，报文: %s", e, metar)
+    return {"raw": metar, "decoded": decoded}
+
+
+def single_airport_response(airport, metar, decode, include_taf=False):
+    """单机场默认返回纯文本（taf=1时TAF另起一行），format=decoded时返回JSON"""
+    taf = get_valid_taf(airport) if include_taf else ""
+    if not decode:
+        return f"{metar}\n{taf}" if taf else metar
+
+    response = {"airport": airport, **decoded_entry(metar)}
+    if include_taf:
+        response["taf"] = taf
+    return json.dumps(response, ensure_ascii=False)
 
 
 @app.route('/<string:airports>', methods=['GET'])
 def handle_airports(airports):
+    trace = trace_store.start(f"/{airports}")
+    try:
+        return _handle_airports(airports, trace)
+    finally:
+        trace_store.finish(trace)
+
+
+def _handle_airports(airports, trace):
     try:
         # 处理空请求
         if not airports:
@@ -493,36 +1311,45 @@ def handle_airports(airports):
         # 移除可能的JSON字符串错误
         airports_clean = airports.strip()
         if airports_clean.startswith('{"ERROR":'):
-            logger.warning(f"收到错误的请求格式: {airports_clean[:100]}")
+            logger.warning("收到错误的请求格式: %s", airports_clean[:100])
             return json.dumps({"error": "Invalid request format"}), 400
 
         # 标准化机场代码
         try:
             airports_list = normalize_airport_codes(airports_clean)
         except ValueError as e:
-            logger.warning(f"无效的机场代码: {airports_clean}")
+            logger.warning("无效的机场代码: %s", airports_clean)
             return json.dumps({"error": str(e)}), 400
 
         # 限制一次性请求的机场数量
         MAX_AIRPORTS = 50
         if len(airports_list) > MAX_AIRPORTS:
             airports_list = airports_list[:MAX_AIRPORTS]
-            logger.warning(f"请求机场数量超过限制，只处理前{MAX_AIRPORTS}个")
+            logger.warning("请求机场数量超过限制，只处理前%s个", MAX_AIRPORTS)
+
+        # format=decoded 时附带解码后的METAR
+        decode = request.args.get('format') == 'decoded'
+        # taf=1 时同时返回TAF
+        include_taf = request.args.get('taf') == '1'
 
         # 检查是否是多个机场
         if len(airports_list) > 1:
-            logger.info(f"收到批量机场代码请求: {airports_list[:5]}...")  # 只显示前5个
+            hot_logger.info("收到批量机场代码请求: %s...", airports_list[:5])  # 只显示前5个
 
             # 获取METAR数据，设置总超时
             start_time = time.time()
             try:
-                results = fetch_metar_for_airports(airports_list)
+                results, g.degraded = fetch_metar_for_airports(airports_list, request.remote_addr, include_taf)
                 elapsed_time = time.time() - start_time
 
                 # 记录性能指标
                 perf_monitor.record_request(elapsed_time)
 
-                logger.info(f"批量请求完成，处理{len(airports_list)}个机场，耗时: {elapsed_time:.2f}秒")
+                hot_logger.info("批量请求完成，处理%s个机场，耗时: %.2f秒", len(airports_list), elapsed_time)
+
+                if decode:
+                    with trace.span("decode"):
+                        results = {airport: decoded_entry(metar) for airport, metar in results.items()}
 
                 # 返回JSON格式结果
                 response = {
@@ -532,51 +1359,55 @@ def handle_airports(airports):
                     "airports_count": len(airports_list),
                     "data": results
                 }
-                return json.dumps(response, ensure_ascii=False)
+                if include_taf:
+                    response["taf"] = {airport: get_valid_taf(airport) for airport in airports_list}
+                with trace.span("serialize"):
+                    return json.dumps(response, ensure_ascii=False)
 
             except Exception as e:
                 elapsed_time = time.time() - start_time
                 perf_monitor.record_request(elapsed_time)
-                logger.error(f"批量处理失败，耗时: {elapsed_time:.2f}秒，错误: {e}")
+                logger.error("批量处理失败，耗时: %.2f秒，错误: %s", elapsed_time, e)
                 return json.dumps({"error": "Failed to fetch METAR data"}), 500
         else:
             # 单个机场处理
             airport_code = airports_list[0]
-            logger.info(f"收到机场代码请求: {airport_code}")
+            hot_logger.debug("收到机场代码请求: %s", airport_code)
 
             # 检查缓存
-            cached = get_cached_metar(airport_code)
+            with trace.span("cache_lookup", airports=1):
+                cached = get_cached_metar(airport_code)
+                if include_taf and get_cached_taf(airport_code) is None:
+                    cached = None
             if cached:
-                logger.info(f"返回缓存的METAR数据: {cached}")
-                return cached
+                hot_logger.debug("返回缓存的METAR数据: %s", cached)
+                return single_airport_response(airport_code, cached, decode, include_taf)
 
             # 获取METAR数据
             start_time = time.time()
             try:
-                results = fetch_metar_for_airports([airport_code])
+                results, g.degraded = fetch_metar_for_airports([airport_code], request.remote_addr, include_taf)
                 elapsed_time = time.time() - start_time
 
                 # 记录性能指标
                 perf_monitor.record_request(elapsed_time)
 
-                logger.info(f"请求完成，耗时: {elapsed_time:.2f}秒")
+                hot_logger.info("请求完成，耗时: %.2f秒", elapsed_time)
 
                 metar = results.get(airport_code, "")
 
-                if metar:
-                    return metar
-                else:
-                    logger.warning(f"无法获取 {airport_code} 的METAR数据")
-                    return ""
+                if not metar:
+                    logger.warning("无法获取 %s 的METAR数据", airport_code)
+                return single_airport_response(airport_code, metar, decode, include_taf)
 
             except Exception as e:
                 elapsed_time = time.time() - start_time
                 perf_monitor.record_request(elapsed_time)
-                logger.error(f"单机场处理失败，耗时: {elapsed_time:.2f}秒，错误: {e}")
-                return ""
+                logger.error("单机场处理失败，耗时: %.2f秒，错误: %s", elapsed_time, e)
+                return single_airport_response(airport_code, "", decode, include_taf)
 
     except Exception as e:
-        logger.error(f"处理请求时发生错误: {e}")
+        logger.error("处理请求时发生错误: %s", e)
         return json.dumps({"error": "Internal server error"}), 500
 
 
@@ -652,6 +1483,8 @@ def index():
             <ul>
                 <li>单个机场：纯文本METAR报文</li>
                 <li>多个机场：JSON格式，包含所有请求机场的数据</li>
+                <li>加上 <code>?taf=1</code>：同时返回TAF（单个机场在METAR下一行，多个机场在JSON的 <code>taf</code> 字段），如 <a href="/ZSSS,ZBAA?taf=1" target="_blank">/ZSSS,ZBAA?taf=1</a></li>
+                <li>加上 <code>?format=decoded</code>：返回原始报文及解码结果（风、能见度、RVR、云、温度、QNH、观测时间、趋势），如 <a href="/ZSSS?format=decoded" target="_blank">/ZSSS?format=decoded</a></li>
             </ul>
 
             <p><strong>其他端点：</strong></p>
@@ -659,6 +1492,7 @@ def index():
                 <li><a href="/health" target="_blank">/health</a> - 健康检查</li>
                 <li><a href="/status" target="_blank">/status</a> - 详细状态</li>
                 <li><a href="/cache/clear" target="_blank">/cache/clear</a> - 清空缓存</li>
+                <li><a href="/debug/traces" target="_blank">/debug/traces</a> - 最慢请求的分阶段耗时</li>
             </ul>
 
             <script>
@@ -710,14 +1544,19 @@ def status_check():
             "size": len(metar_cache),
             "items": list(metar_cache.keys())[:10]  # 只显示前10个
         }
+        taf_cache_size = len(taf_cache)
 
     return json.dumps({
         "status": "healthy",
         "timestamp": time.time(),
         "cache": cache_info,
+        "taf_cache_size": taf_cache_size,
         "vatsim_cache": "available" if vatsim_all_cache else "none",
         "vatsim_cache_length": len(vatsim_all_cache) if vatsim_all_cache else 0,
         "performance": perf_monitor.get_stats(),
+        "decode_cache": decode_metar.cache_info()._asdict(),
+        "admission": admission.get_stats(),
+        "rate_limit": rate_limiter.get_stats(),
         "version": "1.0.1",
         "concurrency": {
             "max_workers": 8,
@@ -727,6 +1566,36 @@ def status_check():
     })
 
 
+@app.route('/debug/traces')
+def debug_traces():
+    """时间窗口内耗时最长的追踪数据，附带最近几个请求作参考"""
+    limit = max(1, request.args.get('limit', 20, type=int))
+    return json.dumps({
+        "timestamp": time.time(),
+        "window_seconds": SLOWEST_TRACE_WINDOW,
+        "slowest_size": SLOWEST_TRACE_COUNT,
+        "buffer_size": TRACE_BUFFER_SIZE,
+        "traces": trace_store.slowest(limit),
+        "recent": trace_store.recent(min(limit, 5))
+    }, ensure_ascii=False)
+
+
+@app.route('/debug/profile')
+def debug_profile():
+    """采样剖析N秒，返回折叠栈格式（可直接交给flamegraph.pl）"""
+    token = request.headers.get('X-Debug-Token') or request.args.get('token', '')
+    if not DEBUG_TOKEN or not hmac.compare_digest(token.encode(), DEBUG_TOKEN.encode()):
+        return json.dumps({"error": "Forbidden"}), 403
+
+    seconds = min(max(request.args.get('seconds', 5, type=float), 0.1), PROFILE_MAX_SECONDS)
+    stacks = profiler.run(seconds, PROFILE_INTERVAL)
+    if stacks is None:
+        return json.dumps({"error": "Profiler already running"}), 409
+
+    folded = "\n".join(f"{stack} {count}" for stack, count in stacks.most_common())
+    return Response(folded + "\n", mimetype='text/plain')
+
+
 @app.route('/cache/clear')
 def clear_cache():
     """清空缓存"""
@@ -734,6 +1603,7 @@ def clear_cache():
 
     with cache_lock:
         metar_cache.clear()
+        taf_cache.clear()
         vatsim_all_cache = None
         vatsim_cache_time = 0
 
@@ -754,7 +1624,7 @@ if __name__ == '__main__':
 
     # 运行应用
     logger.info("METAR服务启动中...")
-    logger.info(f"服务地址: http://localhost:8000")
+    logger.info("服务地址: http://localhost:8000")
     logger.info("按 Ctrl+C 停止服务")
 
     app.run(host='0.0.0.0', port=8000, debug=False, threaded=True)
\ No newline at end of file